@@ -0,0 +1,659 @@
+"""
+Benchmarks of the booking website
+Usage: python benchmark.py <benchmark name> [options]
+Every benchmark runs on its own temporary database - data.sqlite3 is never touched.
+"python benchmark.py suite --output results.json --baseline old_results.json" measures the whole booking flow.
+"""
+import argparse
+import base64
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import unicodedata
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+import main
+from main import app, db, ticket, user, book_tickets, return_all_users, expire_invalid_bookings, \
+    export_booked_tickets, stream_export, search_users, EXPORT_COLUMNS
+
+
+## --database-url - the benchmarks run on this (throwaway!) database instead of a temporary SQLite file
+database_url = None
+
+
+def use_temporary_database():
+    """Points the app to an empty database in a temporary directory (or empties the database of --database-url)"""
+    if database_url:
+        main.configure_database(database_url)
+    else:
+        directory = tempfile.mkdtemp(prefix="tickets_benchmark_")
+        main.configure_database("sqlite:///" + os.path.join(directory, "benchmark.sqlite3"))
+    app.config["MAIL_QUEUE_WORKER"] = False  # Mails stay in the queue
+    with app.app_context():
+        if database_url:
+            db.drop_all()
+        db.create_all()
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "layout.json")) as layout_file:
+            main.create_event(app.config["EVENT_ID"], json.load(layout_file))  # The prom's venue and its sections
+        main.create_user_search_index()
+    main.table_availability_checked_at = None  # The index of the previous database is out of date
+
+
+def create_tickets(tables, standing):
+    """
+    Inserts free tickets - tables: {table ID: number of seats}, standing: number of tickets for standing
+    """
+    rows = [{"table": table_id, "is_for_standing": False} for table_id, seats in tables.items() for _ in range(seats)]
+    rows += [{"table": None, "is_for_standing": True} for _ in range(standing)]
+    for row in rows:
+        row.update(event_id=app.config["EVENT_ID"], is_booked=False, is_paid=False, was_collected=False, time_of_booking=None)
+
+    with app.app_context():
+        db.session.execute(ticket.__table__.insert(), rows)
+        db.session.commit()
+
+
+FIRST_NAMES = ["Jiří", "Jan", "Petr", "Josef", "Pavel", "Tomáš", "Eliška", "Jana", "Tereza", "Lucie", "Kateřina", "Šárka"]
+SURNAMES = ["Novák", "Svoboda", "Dvořák", "Černý", "Procházka", "Kučera", "Veselý", "Horák", "Němec", "Pokorný", "Růžička"]
+
+
+def create_users_with_tickets(number_of_users, tables_per_user=2):
+    """Inserts users who booked seats at a few random tables (and some users without tickets)"""
+    tables = {table_id: 8 for table_id in range(1, 114)}
+    rows = [{"name": f"{random.choice(FIRST_NAMES)} {random.choice(SURNAMES)} {user_id}", "email": f"user{user_id}@example.com",
+        "phone_number": f"+420 {600000000 + user_id}",
+        "place_of_picking_up": random.choice(["office", "ideon", "eight", "four"]), "is_paid": user_id % 2 == 0,
+        "event_id": app.config["EVENT_ID"],
+        "was_collected": False} for user_id in range(1, number_of_users + 1)]
+    ticket_rows = []
+    for user_id in range(1, number_of_users + 1):
+        if user_id % 10 == 0:
+            continue  # Users without tickets
+        for table_id in random.sample(list(tables.keys()), tables_per_user):
+            ticket_rows += [{"event_id": app.config["EVENT_ID"], "user_id": user_id, "table": table_id, "is_for_standing": False, "is_booked": True,
+                "is_paid": user_id % 2 == 0, "was_collected": False, "time_of_booking": datetime.now()}] * 2
+
+    with app.app_context():
+        db.session.execute(user.__table__.insert(), rows)
+        db.session.execute(ticket.__table__.insert(), ticket_rows)
+        db.session.commit()
+
+
+class QueryCounter:
+    """Counts SQL statements executed by the app's engine"""
+    def __init__(self):
+        self.count = 0
+        event.listen(db.engine, "before_cursor_execute", self.before_cursor_execute)
+
+    def before_cursor_execute(self, *args):
+        self.count += 1
+
+    def stop(self):
+        event.remove(db.engine, "before_cursor_execute", self.before_cursor_execute)
+
+
+def benchmark_users_report(args):
+    """The "Filter users" report - the number of queries and the time of a page must not grow with the number of users"""
+    for number_of_users in args.users:
+        use_temporary_database()
+        create_users_with_tickets(number_of_users)
+
+        with app.app_context():
+            counter = QueryCounter()
+            start_time = time.perf_counter()
+            report, page = return_all_users("none", "none", "none")
+            duration = time.perf_counter() - start_time
+            counter.stop()
+
+            start_time = time.perf_counter()
+            return_all_users("none", "none", "none", before_id=number_of_users + 1)  # The last page
+            last_page_duration = time.perf_counter() - start_time
+        print(f"{number_of_users:6} users: {len(report) - 2} lines, {counter.count} queries, {duration * 1000:.1f} ms, "
+            f"last page {last_page_duration * 1000:.1f} ms")
+
+
+def benchmark_search(args):
+    """Looking up users by a part of the name (without diacritics), email or phone number at the pickup desk"""
+    for number_of_users in args.users:
+        use_temporary_database()
+        create_users_with_tickets(number_of_users)
+
+        with app.app_context():
+            ## The beginning of the surname without diacritics and the number of a random user, a part of an email
+            names = [name for (name,) in db.session.query(user.name).order_by(db.func.random()).limit(args.requests)]
+            lookups = [unicodedata.normalize("NFKD", name.split()[1][:4]).encode("ascii", "ignore").decode() + " " +
+                name.split()[2] for name in names]
+            lookups += [f"user{random.randint(1, number_of_users)}@" for _ in range(args.requests)]
+            search_users("warm up")
+            found_users = 0
+            start_time = time.perf_counter()
+            for lookup in lookups:
+                found_users += len(search_users(lookup)) > 0
+            duration = time.perf_counter() - start_time
+            search_method = "full-text index" if main.has_user_search_index() else "LIKE"
+        print(f"{number_of_users:6} users: {len(lookups)} lookups, found {found_users}, "
+            f"{duration / len(lookups) * 1000:.3f} ms per lookup ({search_method})")
+
+
+def benchmark_export(args):
+    """The streamed CSV export of booked tickets - peak memory must stay flat with the number of tickets"""
+    for number_of_users in args.users:
+        use_temporary_database()
+        create_users_with_tickets(number_of_users)
+
+        with app.app_context():
+            tracemalloc.start()
+            start_time = time.perf_counter()
+            rows = export_booked_tickets("none", "none")
+            exported_bytes = sum(len(chunk) for chunk in stream_export(rows, EXPORT_COLUMNS["tickets"], "csv"))
+            duration = time.perf_counter() - start_time
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        print(f"{number_of_users:6} users: {exported_bytes / 1024:.0f} kB exported, peak memory {peak_memory / 1024:.0f} kB, {duration * 1000:.1f} ms")
+
+
+def benchmark_expiry(args):
+    """The sweep of not paid bookings - half of the booked tickets are expired"""
+    use_temporary_database()
+    old_booking = datetime.now() - timedelta(days=30)
+    new_booking = datetime.now()
+    rows = [{"event_id": app.config["EVENT_ID"], "user_id": ticket_id // 4 + 1, "table": ticket_id % 113 + 1, "is_for_standing": False, "is_booked": True,
+        "is_paid": False, "was_collected": False, "time_of_booking": old_booking if ticket_id % 2 else new_booking}
+        for ticket_id in range(args.tickets_total)]
+    users = [{"id": user_id, "event_id": app.config["EVENT_ID"], "name": f"User {user_id}", "email": f"user{user_id}@example.com",
+        "phone_number": "123456789", "place_of_picking_up": "office", "is_paid": False, "was_collected": False}
+        for user_id in range(1, args.tickets_total // 4 + 2)]
+    with app.app_context():
+        db.session.execute(user.__table__.insert(), users)
+        db.session.execute(ticket.__table__.insert(), rows)
+        db.session.commit()
+
+        start_time = time.perf_counter()
+        cancelled_tickets = expire_invalid_bookings()
+        duration = time.perf_counter() - start_time
+    print(f"{args.tickets_total} booked tickets, cancelled: {sum(row.number_of_tickets for row in cancelled_tickets)}, duration: {duration * 1000:.1f} ms")
+
+
+def benchmark_subscribers(args):
+    """Idle /events/availability clients - a booking is pushed to all of them without any database query"""
+    use_temporary_database()
+    app.config["AVAILABILITY_EVENTS"] = True
+    create_tickets({table_id: 8 for table_id in range(1, 114)}, 0)
+    client = app.test_client()
+    client.get("/api/availability")  # Loads the availability index
+
+    streams = []
+    for _ in range(args.subscribers):
+        response = client.get("/events/availability", buffered=False)
+        stream = iter(response.response)
+        next(stream)  # The whole availability
+        streams.append(stream)
+
+    with app.app_context():
+        counter = QueryCounter()
+        time.sleep(1)
+        idle_queries = counter.count
+
+        start_time = time.perf_counter()
+        book_tickets({1: 2}, 1)
+        booking_queries = counter.count - idle_queries
+        events = [next(stream) for stream in streams]
+        duration = time.perf_counter() - start_time
+        counter.stop()
+
+    received = sum(1 for event in events if '"1": 6' in event.decode())
+    print(f"{args.subscribers} subscribers, queries while idle: {idle_queries}, queries of the booking: {booking_queries}")
+    print(f"Subscribers which received the change: {received}, duration: {duration * 1000:.1f} ms")
+    for stream in streams:
+        stream.close()
+    if idle_queries > 0 or received != args.subscribers:
+        raise SystemExit("Idle subscribers used the database or did not receive the change!")
+
+
+def benchmark_contention(args):
+    """Many threads booking seats at the same table at once - no ticket may be booked twice"""
+    use_temporary_database()
+    create_tickets({1: args.seats}, 0)
+
+    results = []
+    errors = []
+    start_barrier = threading.Barrier(args.threads)
+
+    def buyer(user_id):
+        with app.app_context():
+            start_barrier.wait()
+            try:
+                short_tables = book_tickets({1: args.tickets}, user_id)
+                results.append(short_tables == {})
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=buyer, args=(user_id,)) for user_id in range(1, args.threads + 1)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start_time
+
+    with app.app_context():
+        booked_tickets = ticket.query.filter(ticket.is_booked==True).count()
+        booked_users = db.session.query(ticket.user_id).filter(ticket.is_booked==True).distinct().count()
+
+    successful = results.count(True)
+    print(f"{args.threads} buyers, {args.tickets} tickets each, {args.seats} seats at the table")
+    print(f"Successful bookings: {successful}, refused: {results.count(False)}, errors: {len(errors)}")
+    print(f"Booked tickets: {booked_tickets} (expected {successful * args.tickets}), users with tickets: {booked_users}")
+    print(f"Duration: {duration * 1000:.1f} ms")
+    if booked_tickets != successful * args.tickets or booked_users != successful:
+        raise SystemExit("Tickets were booked twice!")
+
+
+class StubFioBank:
+    """Local replacement of fiobank.FioBank - every second synthetic user paid for their tickets"""
+    def __init__(self, token):
+        self.token = token
+
+    def last(self, from_id=None, from_date=None):
+        if from_id is not None:
+            return []
+        paid_users = db.session.query(ticket.user_id, db.func.count(ticket._id)).filter(
+            ticket.is_booked==True, ticket.user_id % 2 == 0).group_by(ticket.user_id).all()
+        return [{"transaction_id": user_id, "variable_symbol": str(user_id), "amount": number_of_tickets * main.PRICE,
+            "currency": "CZK", "date": datetime.now().date(), "account_number_full": "123/0800",
+            "user_identification": f"User {user_id}", "recipient_message": ""} for user_id, number_of_tickets in paid_users]
+
+    def period(self, begin, end):
+        return self.last(from_date=begin)
+
+
+def measure(name, function, number_of_requests):
+    """Calls the function number_of_requests times - returns latencies (p50, p99 in ms), throughput and failed calls"""
+    latencies = []
+    errors = 0
+    start_time = time.perf_counter()
+    for request_number in range(number_of_requests):
+        request_start = time.perf_counter()
+        if not function(request_number):
+            errors += 1
+        latencies.append(time.perf_counter() - request_start)
+    duration = time.perf_counter() - start_time
+
+    latencies.sort()
+    def percentile(fraction):
+        return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 2)
+    result = {"requests": number_of_requests, "errors": errors, "p50_ms": percentile(0.5), "p99_ms": percentile(0.99),
+        "throughput_rps": round(number_of_requests / duration, 1)}
+    print(f"{name:18} p50 {result['p50_ms']:8.2f} ms   p99 {result['p99_ms']:8.2f} ms   {result['throughput_rps']:8.1f} req/s   errors: {errors}")
+    return result
+
+
+def benchmark_suite(args):
+    """
+    The booking flow through the real Flask app (test client) on a synthetic database of args.size users
+    Mails stay in the queue and the Fio API is replaced by StubFioBank
+    """
+    use_temporary_database()
+    random.seed(args.seed)
+    create_users_with_tickets(args.size)
+    seats_per_table = args.requests * 2 // 113 + 4  # Enough free seats for all seated bookings
+    create_tickets({table_id: seats_per_table for table_id in range(1, 114)}, args.requests * 2)
+    main.FioBank = StubFioBank
+
+    admin_headers = {"Authorization": "Basic " + base64.b64encode(b"administration:").decode()}
+    admin_form = {"user_id": "0", "ticket_id": "0", "paid_true_false": "none", "picked_up_true_false": "none", "place": "none"}
+    user_form = {"user_name": "Benchmark User", "email": "benchmark@example.com", "phone_number": "123456789",
+        "place_of_picking_up": "office"}
+
+    def map_load(request_number):
+        client = app.test_client()
+        return client.get("/show_table_map").status_code == 200 and client.get("/api/availability").status_code == 200
+
+    def standing_booking(request_number):
+        client = app.test_client()
+        response = client.post("/form_standing", data=dict(user_form, number_of_tickets="2"))
+        return response.status_code == 302 and client.get("/summary_page").status_code == 200
+
+    def seated_booking(request_number):
+        client = app.test_client()
+        client.post("/form_sitting", data=user_form)
+        client.get("/table_map")
+        client.post("/table_map", data={f"field{request_number % 113 + 1}": "2"})  # The seats are held
+        response = client.post("/confirm_booking", data={"submit_btn": "confirm"})
+        return response.status_code == 302 and client.get("/summary_page").status_code == 200
+
+    def admin_report(submit_btn):
+        def report(request_number):
+            client = app.test_client()
+            response = client.post("/administration", headers=admin_headers, data=dict(admin_form, submit_btn=submit_btn))
+            return response.status_code == 200
+        return report
+
+    scenarios = {
+        "map_load": (map_load, args.requests),
+        "standing_booking": (standing_booking, args.requests),
+        "seated_booking": (seated_booking, args.requests),
+        "admin_users": (admin_report("show_users"), args.requests),
+        "admin_tickets": (admin_report("show_tickets"), args.requests),
+        "payments": (admin_report("payments"), 3),  # Only the first run finds new movements
+    }
+    results = {"config": {"size": args.size, "requests": args.requests, "seed": args.seed}, "results": {}}
+    for name, (function, number_of_requests) in scenarios.items():
+        results["results"][name] = measure(name, function, number_of_requests)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        print("\nChange against the baseline:")
+        for name, result in results["results"].items():
+            if name in baseline:
+                changes = [f"{key} {(result[key] / baseline[name][key] - 1) * 100:+.0f} %"
+                    for key in ["p50_ms", "p99_ms", "throughput_rps"] if baseline[name][key]]
+                print(f"{name:18} " + "   ".join(changes))
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=4)
+    else:
+        print(json.dumps(results, indent=4))
+
+
+def benchmark_waiting_room(args):
+    """args.waiting users in the waiting room polling their position - the polls must not touch the database"""
+    use_temporary_database()
+    app.config["WAITING_ROOM"] = True
+    clients = [app.test_client() for _ in range(args.waiting)]
+
+    with app.app_context():
+        join_counter = QueryCounter()
+        start_time = time.perf_counter()
+        for client in clients:
+            client.get("/form_standing")  # Redirected to the waiting room
+            client.get("/waiting_room?next=form_standing")
+        join_duration = time.perf_counter() - start_time
+        join_counter.stop()
+
+        counter = QueryCounter()
+        result = measure("status poll", lambda request_number: clients[request_number].get("/waiting_room/status").status_code == 200,
+            args.waiting)
+        counter.stop()
+
+    admitted = sum(1 for client in clients if client.get("/waiting_room/status").get_json()["admitted"])
+    allowed = app.config["WAITING_ROOM_RATE"] * (time.perf_counter() - start_time) + 1
+    print(f"{args.waiting} waiting users joined in {join_duration:.1f} s ({join_counter.count / args.waiting:.1f} queries "
+        f"per user - the blocks of slots), admitted so far: {admitted}, database queries of the polls: {counter.count}")
+    if counter.count:
+        raise SystemExit("The waiting room used the database!")
+    if admitted > allowed:
+        raise SystemExit(f"More users were let in than WAITING_ROOM_RATE allows ({allowed:.0f})!")
+
+
+def stress_worker(worker_number, args, start_event, results):
+    """One process of the stress benchmark - standing bookings through the app at args.rate bookings per second"""
+    db.engine.dispose()  # Connections must not be shared with the parent process
+    app.config["PROPAGATE_EXCEPTIONS"] = True
+    client = app.test_client()
+    user_form = {"user_name": f"Stress {worker_number}", "email": "stress@example.com", "phone_number": "123456789",
+        "place_of_picking_up": "office", "number_of_tickets": "1"}
+    bookings, lock_errors, other_errors = 0, 0, []
+
+    start_event.wait()
+    start_time = time.perf_counter()
+    for booking_number in range(args.bookings):
+        # Bookings are spread evenly over time - the processes together make args.rate bookings per second
+        delay = start_time + booking_number * args.processes / args.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            with client.session_transaction() as session:
+                session.clear()
+            response = client.post("/form_standing", data=user_form)
+            if response.status_code == 302 and client.get("/summary_page").status_code == 200:
+                bookings += 1
+            else:
+                other_errors.append(f"status {response.status_code}")
+        except Exception as e:
+            if "locked" in str(e):
+                lock_errors += 1
+            else:
+                other_errors.append(repr(e))
+    results.put((bookings, lock_errors, other_errors[:3]))
+
+
+def benchmark_stress(args):
+    """Several processes booking standing tickets at once (like several server workers) - there must be no lock errors"""
+    use_temporary_database()
+    create_tickets({}, args.processes * args.bookings)
+
+    context = multiprocessing.get_context("fork")
+    start_event = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target=stress_worker, args=(worker_number, args, start_event, results))
+        for worker_number in range(args.processes)]
+    for process in processes:
+        process.start()
+    start_time = time.perf_counter()
+    start_event.set()
+    worker_results = [results.get() for _ in processes]
+    duration = time.perf_counter() - start_time
+    for process in processes:
+        process.join()
+
+    bookings = sum(result[0] for result in worker_results)
+    lock_errors = sum(result[1] for result in worker_results)
+    other_errors = [error for result in worker_results for error in result[2]]
+    with app.app_context():
+        booked_tickets = ticket.query.filter(ticket.is_booked==True).count()
+    print(f"{args.processes} processes, {args.bookings} bookings each, target {args.rate} bookings/s")
+    print(f"Bookings: {bookings} ({bookings / duration:.1f}/s), booked tickets: {booked_tickets}, "
+        f"lock errors: {lock_errors}, other errors: {len(other_errors)} {other_errors}")
+    if lock_errors or other_errors:
+        raise SystemExit("Some bookings failed!")
+
+
+def benchmark_bulk_edit(args):
+    """A class representative pays for 40 users - 40 single "User paid" posts against one bulk post"""
+    use_temporary_database()
+    create_users_with_tickets(args.size)
+    client = app.test_client()
+    headers = {"Authorization": "Basic " + base64.b64encode(b"administration:").decode()}
+    form = {"paid_true_false": "none", "picked_up_true_false": "none", "place": "none", "ticket_id": "", "true_false": "true"}
+    not_paid_ids = list(range(1, 161, 2))  # Odd users have not paid
+
+    counter = QueryCounter()
+    start_time = time.perf_counter()
+    for user_id in not_paid_ids[:40]:
+        client.post("/administration", data=dict(form, submit_btn="set_paid", user_id=str(user_id)), headers=headers)
+    single_duration, single_queries = time.perf_counter() - start_time, counter.count
+    counter.stop()
+
+    counter = QueryCounter()
+    start_time = time.perf_counter()
+    client.post("/administration", data=dict(form, submit_btn="bulk_set_paid", user_id="",
+        user_ids=", ".join(str(user_id) for user_id in not_paid_ids[40:])), headers=headers)
+    bulk_duration, bulk_queries = time.perf_counter() - start_time, counter.count
+    counter.stop()
+
+    with app.app_context():
+        paid_users = user.query.filter(user.id.in_(not_paid_ids), user.is_paid==True).count()
+        queued_mails = main.queued_mail.query.count()
+    print(f"40 single posts: {single_duration * 1000:.0f} ms, {single_queries} queries")
+    print(f"1 bulk post of 40 users: {bulk_duration * 1000:.0f} ms, {bulk_queries} queries")
+    print(f"Paid users: {paid_users} (expected {len(not_paid_ids)}), queued mails: {queued_mails}")
+
+
+def write_fio_csv_statement(statement_file, movements):
+    """Writes the movements [(ID, variable symbol, amount, date)] as Fio's CSV statement"""
+    statement_file.write('"accountId";"2000000000"\n"bankId";"2010"\n"currency";"CZK"\n\n'.encode())
+    statement_file.write('"ID pohybu";"Datum";"Objem";"Měna";"Protiúčet";"Název protiúčtu";"Kód banky";"Název banky";"KS";"VS";'
+        '"SS";"Uživatelská identifikace";"Zpráva pro příjemce";"Typ"\n'.encode())
+    for transaction_id, variable_symbol, amount, movement_date in movements:
+        statement_file.write((f'"{transaction_id}";"{movement_date:%d.%m.%Y}";"{amount},00";"CZK";"123456789";"Novák Jan";"0800";'
+            f'"Česká spořitelna";"0308";"{variable_symbol}";"";"NOVÁK JAN";"Vstupenky na ples";"Bezhotovostní příjem"\n').encode())
+
+
+def write_gpc_statement(statement_file, movements):
+    """Writes the movements [(ID, variable symbol, amount, date)] as a GPC (ABO) statement"""
+    statement_file.write(("074" + "2000000000".zfill(16) + "Maturitni ples".ljust(20) + "0".ljust(86)).encode("cp1250") + b"\r\n")
+    for transaction_id, variable_symbol, amount, movement_date in movements:
+        statement_file.write(("075" + "2000000000".zfill(16) + "123456789".zfill(16) + str(transaction_id).zfill(13) +
+            str(amount * 100).zfill(12) + "2" + str(variable_symbol).zfill(10) + "00" + "0800" + "0308" + "0".zfill(10) +
+            f"{movement_date:%d%m%y}" + "Novák Jan".ljust(20) + "0" + "0203" + f"{movement_date:%d%m%y}").encode("cp1250") + b"\r\n")
+        statement_file.write(("078" + "Vstupenky na ples".ljust(35) + "".ljust(35)).encode("cp1250") + b"\r\n")
+
+
+def benchmark_statement_import(args):
+    """Import of exported bank statements with args.lines movements - peak memory must stay flat, all the payers get paid"""
+    for write_statement in [write_fio_csv_statement, write_gpc_statement]:
+        for number_of_lines in [args.lines // 4, args.lines]:
+            use_temporary_database()
+            create_users_with_tickets(args.size)
+            with app.app_context():
+                ## Exact payments of the users who have not paid yet, then movements of other people
+                prices = dict(db.session.query(ticket.user_id, db.func.count(ticket._id) * main.PRICE).filter(
+                    ticket.is_paid==False).group_by(ticket.user_id).all())
+            movements = itertools.chain(
+                ((user_id, user_id, price, datetime.now()) for user_id, price in prices.items()),
+                ((transaction_id, random.randint(10 ** 6, 10 ** 7), random.randint(1, 5000), datetime.now())
+                    for transaction_id in range(10 ** 6, 10 ** 6 + number_of_lines - len(prices))))
+            statement_path = os.path.join(tempfile.mkdtemp(prefix="tickets_statement_"), "statement")
+            with open(statement_path, "wb") as statement_file:
+                write_statement(statement_file, movements)
+
+            with app.app_context():  # No request - like flask import-statement
+                tracemalloc.start()
+                start_time = time.perf_counter()
+                with open(statement_path, "rb") as statement_file:
+                    number_of_transactions, new_transactions = main.import_bank_statement(statement_file)
+                import_duration = time.perf_counter() - start_time
+                _, peak_memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                paid_results = [line for line in main.reconcile_payments() if " paid (" in line]
+                payment_mails = main.queued_mail.query.filter(main.queued_mail.subject.like("%were paid%")).count()
+                with open(statement_path, "rb") as statement_file:
+                    _, new_again = main.import_bank_statement(statement_file)
+            print(f"{write_statement.__name__[6:-10]:8} {number_of_lines:7} movements: {import_duration:.1f} s, "
+                f"peak memory {peak_memory / 1024:.0f} kB, saved {new_transactions} of {number_of_transactions}, "
+                f"paid users {len(paid_results)} of {len(prices)} (payment mails {payment_mails}), "
+                f"new movements on the second import: {new_again}")
+            if new_transactions != number_of_lines or len(paid_results) != len(prices) or payment_mails != len(prices) \
+                    or new_again != 0:
+                raise SystemExit("The statement was not imported correctly!")
+
+
+def check_in_worker(worker_number, args, codes, start_event, results):
+    """One process (server worker) of the check-in benchmark - its door devices scan the codes as fast as they can"""
+    db.engine.dispose()  # Connections must not be shared with the parent process
+    app.config["PROPAGATE_EXCEPTIONS"] = True
+    client = app.test_client()
+    headers = {"Authorization": "Basic " + base64.b64encode(b"office:").decode()}
+    scans = codes + codes[::20]  # Every 20th ticket is scanned twice
+    results_count, durations, errors = {}, [], []
+
+    start_event.wait()
+    for code in scans:
+        start_time = time.perf_counter()
+        try:
+            result = client.post("/check_in", json={"code": code}, headers=headers).get_json()["result"]
+            results_count[result] = results_count.get(result, 0) + 1
+        except Exception as e:
+            errors.append(repr(e))
+        durations.append(time.perf_counter() - start_time)
+    with app.app_context():
+        main.save_check_ins()  # The last batch
+    results.put((results_count, durations, errors[:3]))
+
+
+def benchmark_check_in(args):
+    """Door devices scanning the tickets of args.size users on several server processes - every ticket is checked in once"""
+    use_temporary_database()
+    create_users_with_tickets(args.size)
+    with app.app_context():
+        paid_tickets = ticket.query.filter(ticket.is_paid==True).all()
+        codes = [main.create_ticket_code(_ticket) for _ticket in paid_tickets]
+    random.shuffle(codes)
+
+    context = multiprocessing.get_context("fork")
+    start_event = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target=check_in_worker,
+        args=(worker_number, args, codes[worker_number::args.processes], start_event, results))
+        for worker_number in range(args.processes)]
+    for process in processes:
+        process.start()
+    start_time = time.perf_counter()
+    start_event.set()
+    worker_results = [results.get() for _ in processes]
+    duration = time.perf_counter() - start_time
+    for process in processes:
+        process.join()
+
+    results_count = {}
+    for worker_count, _, _ in worker_results:
+        for result, count in worker_count.items():
+            results_count[result] = results_count.get(result, 0) + count
+    durations = sorted(duration for _, worker_durations, _ in worker_results for duration in worker_durations)
+    errors = [error for _, _, worker_errors in worker_results for error in worker_errors]
+    with app.app_context():
+        collected_tickets = ticket.query.filter(ticket.was_collected==True).count()
+        collected_users = user.query.filter(user.was_collected==True).count()
+        users_with_paid_tickets = db.session.query(ticket.user_id).filter(ticket.is_paid==True).distinct().count()
+    print(f"{args.processes} processes, {len(codes)} tickets, {len(durations)} scans ({len(durations) / duration:.0f}/s), "
+        f"p50 {durations[len(durations) // 2] * 1000:.2f} ms, p99 {durations[int(len(durations) * 0.99)] * 1000:.2f} ms")
+    print(f"Results: {results_count}, errors: {len(errors)} {errors}")
+    print(f"Checked-in tickets in the database: {collected_tickets}, users with all tickets checked in: {collected_users}")
+    if errors or results_count.get("ok") != len(codes) or collected_tickets != len(codes) or \
+            collected_users != users_with_paid_tickets:
+        raise SystemExit("Some tickets were not checked in exactly once!")
+
+
+BENCHMARKS = {
+    "contention": benchmark_contention,
+    "users_report": benchmark_users_report,
+    "expiry": benchmark_expiry,
+    "export": benchmark_export,
+    "search": benchmark_search,
+    "subscribers": benchmark_subscribers,
+    "suite": benchmark_suite,
+    "stress": benchmark_stress,
+    "waiting_room": benchmark_waiting_room,
+    "check_in": benchmark_check_in,
+    "bulk_edit": benchmark_bulk_edit,
+    "statement_import": benchmark_statement_import,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the booking website")
+    parser.add_argument("benchmark", choices=BENCHMARKS.keys())
+    parser.add_argument("--threads", type=int, default=50, help="number of concurrent buyers")
+    parser.add_argument("--tickets", type=int, default=2, help="tickets booked by each buyer")
+    parser.add_argument("--seats", type=int, default=40, help="seats at the contended table")
+    parser.add_argument("--subscribers", type=int, default=1000, help="number of /events/availability clients")
+    parser.add_argument("--tickets-total", type=int, default=50000, help="number of generated tickets")
+    parser.add_argument("--users", type=int, nargs="+", default=[100, 1000, 5000], help="numbers of generated users")
+    parser.add_argument("--processes", type=int, default=8, help="number of processes of the stress benchmark")
+    parser.add_argument("--bookings", type=int, default=50, help="bookings made by each process of the stress benchmark")
+    parser.add_argument("--rate", type=float, default=50, help="bookings per second of all the processes together")
+    parser.add_argument("--database-url", help="run on this throwaway database (e.g. PostgreSQL) - all its data is deleted")
+    parser.add_argument("--waiting", type=int, default=10000, help="users in the waiting room")
+    parser.add_argument("--size", type=int, default=5000, help="number of synthetic users of the suite")
+    parser.add_argument("--lines", type=int, default=200000, help="movements of the imported bank statement")
+    parser.add_argument("--requests", type=int, default=200, help="requests of each scenario of the suite")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the synthetic database")
+    parser.add_argument("--output", help="JSON file for the results of the suite")
+    parser.add_argument("--baseline", help="JSON results of an earlier run of the suite to compare with")
+    args = parser.parse_args()
+    database_url = args.database_url
+
+    BENCHMARKS[args.benchmark](args)
@@ -1,29 +1,62 @@
 from flask import render_template
+from datetime import datetime, date
+from decimal import Decimal
+import csv
+import hashlib
+import io
+import itertools
+import json
 
 ## Constants
 PRICE = 300
 ACCOUNT_NUMBER = "XXXXXXXX/XXXX"
 NUMBER_OF_TICKETS_LIMIT = 21
 BOOKING_DAYS_LIMIT = 3
+WAITING_ROOM_TOKEN_HOURS = 6  # Older queue tokens are not valid
+WAITING_ROOM_BLOCK_SLOTS = 20  # Slots of the waiting room reserved in the database at once by one server process
+SEAT_HOLD_MINUTES = 10  # Seats chosen on the hall's map are held for the user until they confirm the booking
 FIO_TOKEN = ""
+BANK_SYNC_START_DATE = "2021-07-01"  # The first sync downloads movements since this date
+ADMIN_EMAIL = "admin_mailk@example.com"
+ADMIN_PAGE_SIZE = 100  # Users or tickets shown on one page of the administration listings
+ADMIN_SEARCH_RESULTS = 10  # Users found by the name, email or phone number
+BULK_EDIT_LIMIT = 500  # Users set as paid or picked up at once
+EXPORT_CHUNK_ROWS = 1000  # Rows read from the database and sent to the browser at once
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")  # Texts a spreadsheet would run as formulas
+BANK_IMPORT_CHUNK_ROWS = 1000  # Movements of an imported bank statement saved in one transaction
+AVAILABILITY_EVENTS_QUEUE_SIZE = 100  # Changes waiting for one /events/availability client
+MAIL_CLAIM_SECONDS = 300  # A mail claimed by a crashed worker is sent again after this time
 
+## Histograms of /administration/metrics - name: (description, upper bounds of the buckets)
+SECONDS_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+METRICS = {
+    "request_duration_seconds": ("Duration of requests", SECONDS_BUCKETS),
+    "request_queries": ("Number of SQL queries issued by one request", [0, 1, 2, 5, 10, 20, 50, 100, 500]),
+    "query_duration_seconds": ("Duration of SQL queries", SECONDS_BUCKETS),
+    "render_duration_seconds": ("Rendering of templates", SECONDS_BUCKETS),
+    "mail_queue_duration_seconds": ("Queueing of mails to users (send_mail_to_user)", SECONDS_BUCKETS),
+    "smtp_duration_seconds": ("Sending of one mail to the SMTP server", SECONDS_BUCKETS),
+    "fio_duration_seconds": ("Downloads from the Fio bank API", SECONDS_BUCKETS),
+}
 
-def create_summary_mail(user, tables_info, number_of_tickets):
+
+def create_summary_mail(user, tables_info, number_of_tickets, ticket_codes):
     tables_info_text = ', '.join(tables_info)
 
     subject = "Confirmation of ticket booking for Gyholi Maturita Prom"
 
     html_body = render_template("confirmation_mail.html", user=user, 
-            tables_info=tables_info_text, number_of_tickets=number_of_tickets, price=PRICE, account_number=ACCOUNT_NUMBER
+            tables_info=tables_info_text, number_of_tickets=number_of_tickets, price=PRICE, account_number=ACCOUNT_NUMBER,
+            ticket_codes=ticket_codes
     )
 
     return subject, html_body
 
 
-def create_payment_mail(user, total_payment):
+def create_payment_mail(user, total_payment, ticket_codes):
     subject = "Your Prom tickets were paid for"
 
-    html_body = render_template("payment_mail.html", uzivatel=user, total_price=total_payment)
+    html_body = render_template("payment_mail.html", uzivatel=user, total_price=total_payment, ticket_codes=ticket_codes)
 
     return subject, html_body
 
@@ -35,7 +68,7 @@ def create_cancellation_mail():
 
 
 
-def get_ticket_text(_ticket):
+def get_ticket_text(_ticket, table_labels):
     if _ticket.is_paid == False:
         pay_text = "not paid"
     else:
@@ -47,14 +80,11 @@ def get_ticket_text(_ticket):
 
     if _ticket.table is None:
         table = "standing"
-    elif _ticket.table <= 43:
-        table = f"table {str(_ticket.table)} (Great Hall)"
-    elif _ticket.table <= 65:
-        table = f"table {str(_ticket.table)} (Left Hall)"
-    elif _ticket.table <= 83:
-        table = f"table {str(_ticket.table)} (Right Hall)"
     else:
-        table = f"table {str(_ticket.table - 83)} (Second Floor) <i>({_ticket.table})</i>"
+        table_number, section_name = table_labels.get(_ticket.table, (_ticket.table, "Hall"))
+        table = f"table {str(table_number)} ({section_name})"
+        if table_number != _ticket.table:
+            table += f" <i>({_ticket.table})</i>"
 
     return f" ID: {_ticket._id}, user ID: {_ticket.user_id}, time: {str(_ticket.time_of_booking).split('.')[0]}, {table}, \
 {pay_text}, {pick_text}"
@@ -87,7 +117,10 @@ def get_user_info_text(user, number_of_tickets):
     return text_to_return
 
 
-def return_tables_info(tables_tickets_dict):
+def return_tables_info(tables_tickets_dict, table_labels):
+    """
+    table_labels: {table ID: (number of the table in its section, section name)} of the event (return_table_labels)
+    """
     info_list = []
     number_of_tickets = 0
     if None in tables_tickets_dict.keys():
@@ -101,15 +134,172 @@ def return_tables_info(tables_tickets_dict):
         if table_id == 0:
             info_list.append(f"({table_seats} tickets for standing)")
             continue
-        elif table_id <= 43:
-            hall = "Great Hall"
-        elif table_id <= 65:
-            hall = "Left Hall"
-        elif table_id <= 83:
-            hall = "Right Hall"
+        table_number, section_name = table_labels.get(table_id, (table_id, "Hall"))
+        info_list.append(f"table no. {str(table_number)} ({section_name}, {str(table_seats)} seats)")
+
+    return info_list, number_of_tickets
+
+
+def get_short_tables_text(short_tables, table_labels):
+    tables_info, _ = return_tables_info(short_tables, table_labels)
+    return "Tickets could not be booked (someone was probably faster). Available tickets: " + ", ".join(tables_info) + ". Please, try it again."
+
+
+def escape_csv_cell(value):
+    """'=1+1' -> "'=1+1" - spreadsheets would run the texts starting with CSV_FORMULA_PREFIXES as formulas"""
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_export(rows, columns, file_format):
+    """
+    Yields the rows (dicts) as CSV ("csv") or JSON lines ("jsonl") in chunks of EXPORT_CHUNK_ROWS rows
+    The texts in the CSV are escaped by escape_csv_cell (names, emails and notes are written by the users)
+    """
+    buffer = io.StringIO()
+    if file_format == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=columns)
+        writer.writeheader()
+
+    for row_number, row in enumerate(rows, 1):
+        if file_format == "csv":
+            writer.writerow({key: escape_csv_cell(value) for key, value in row.items()})
         else:
-            hall = "Second Floor"
-            table_id = table_id - 83
-        info_list.append(f"table no. {str(table_id)} ({hall}, {str(table_seats)} seats)")
+            buffer.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+
+        if row_number % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+## Columns of Fio's CSV statements (internet banking and API exports) - key of the movement: possible column names
+FIO_CSV_COLUMNS = {
+    "transaction_id": ["ID pohybu", "ID operace"],
+    "date": ["Datum"],
+    "amount": ["Objem"],
+    "currency": ["Měna"],
+    "account_number": ["Protiúčet"],
+    "bank_code": ["Kód banky"],
+    "variable_symbol": ["VS"],
+    "user_identification": ["Uživatelská identifikace", "Název protiúčtu"],
+    "recipient_message": ["Zpráva pro příjemce"],
+}
+GPC_CURRENCIES = {"0203": "CZK", "0978": "EUR", "0840": "USD"}  # ISO 4217 numeric codes of the GPC movements
+
+
+def normalize_variable_symbol(text):
+    """'0000000012 ' -> '12', empty or zero -> None"""
+    text = "".join((text or "").split()).lstrip("0")
+    return text or None
+
+
+def normalize_amount(text):
+    """'1 234,50' -> Decimal('1234.50')"""
+    return Decimal("".join(text.split()).replace(",", "."))
+
+
+def read_bank_statement(statement_file):
+    """
+    Yields the movements of an exported bank statement (binary file) one by one - Fio CSV or GPC (ABO)
+    The movements are dicts like the ones of the Fio API (see save_bank_transactions), the file is never read whole
+    """
+    first_line = statement_file.readline()
+    lines = itertools.chain([first_line], statement_file)
+    if first_line.startswith(b"074"):
+        return read_gpc_statement(line.decode("cp1250") for line in lines)
+    return read_fio_csv_statement(decode_csv_line(line) for line in lines)
+
+
+def decode_csv_line(line):
+    try:
+        return line.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return line.decode("cp1250")  # Older exports
+
+
+def read_fio_csv_statement(lines):
+    """Yields movements of Fio's CSV statement - the lines before the header of the movements are skipped"""
+    columns = None
+    for row in csv.reader(lines, delimiter=";"):
+        if columns is None:
+            if row and row[0].strip() in FIO_CSV_COLUMNS["transaction_id"]:
+                names = [name.strip() for name in row]
+                columns = {key: next((names.index(name) for name in key_names if name in names), None)
+                    for key, key_names in FIO_CSV_COLUMNS.items()}
+            continue
+        if not row or not row[0].strip().isdecimal():
+            continue  # Empty lines, totals
+
+        def value(key):
+            column = columns[key]
+            return row[column].strip() if column is not None and column < len(row) else ""
+
+        account_number = value("account_number")
+        if account_number and value("bank_code"):
+            account_number += "/" + value("bank_code")
+        yield {
+            "transaction_id": value("transaction_id"),
+            "variable_symbol": normalize_variable_symbol(value("variable_symbol")),
+            "amount": normalize_amount(value("amount")),
+            "currency": value("currency") or "CZK",
+            "date": datetime.strptime(value("date"), "%d.%m.%Y").date(),
+            "account_number_full": account_number or None,
+            "user_identification": value("user_identification") or None,
+            "recipient_message": value("recipient_message") or None,
+        }
+
+
+def read_gpc_date(text):
+    """'170622' (DDMMYY) -> date(2022, 6, 17)"""
+    return date(2000 + int(text[4:6]), int(text[2:4]), int(text[0:2]))
+
+
+def read_gpc_statement(lines):
+    """
+    Yields movements of a GPC (ABO) statement - fixed-width lines: 074 statement, 075 movement, 078/079 its messages
+    Movements without a document number get an ID made of their date, amount, variable symbol and counter account
+    """
+    movement = None
+    fallback_ids = {}  # {movement's data: how many such movements were read} - same payments of one day differ by the count
+    for line in lines:
+        line = line.rstrip("\r\n").ljust(128)
+        record_type = line[0:3]
+        if record_type in ["078", "079"] and movement is not None:
+            messages = [line[3:38].strip(), line[38:73].strip()]
+            movement["recipient_message"] = " ".join(filter(None, [movement["recipient_message"]] + messages)) or None
+            continue
+        if movement is not None:
+            yield movement
+            movement = None
+        if record_type != "075":
+            continue
 
-    return info_list, number_of_tickets
\ No newline at end of file
+        counter_account, bank_code = line[19:35], line[73:77]
+        prefix, number = int(counter_account[:6] or 0), int(counter_account[6:] or 0)
+        account_number = None
+        if number:
+            account_number = (f"{prefix}-{number}" if prefix else f"{number}") + f"/{bank_code}"
+        amount = Decimal(int(line[48:60])) / 100
+        if line[60] in ["1", "5"]:  # Debit, cancelled credit
+            amount = -amount
+        transaction_id = line[35:48].strip().lstrip("0")
+        if not transaction_id:
+            movement_data = f"{line[91:97]}|{line[48:61]}|{line[61:71]}|{counter_account}/{bank_code}"
+            fallback_ids[movement_data] = fallback_ids.get(movement_data, 0) + 1
+            movement_data += f"|{fallback_ids[movement_data]}"
+            transaction_id = "gpc-" + hashlib.sha1(movement_data.encode()).hexdigest()[:24]  # Fits bank_transaction's 30 chars
+        movement = {
+            "transaction_id": transaction_id,
+            "variable_symbol": normalize_variable_symbol(line[61:71]),
+            "amount": amount,
+            "currency": GPC_CURRENCIES.get(line[118:122], line[118:122]),
+            "date": read_gpc_date(line[91:97]),
+            "account_number_full": account_number,
+            "user_identification": line[97:117].strip() or None,
+            "recipient_message": None,
+        }
+    if movement is not None:
+        yield movement
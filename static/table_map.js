@@ -40,11 +40,12 @@ function show(id_divu, id_buttonu){
 }
 
 
-function oncheck(cislo_stolu, volnych_mist, cislo_v_salu, sal_str){
+function oncheck(cislo_stolu, cislo_v_salu, sal_str){
     text_field_div = document.getElementById("field_div"+cislo_stolu)
+    button_clicked = document.getElementById(cislo_stolu)
+    volnych_mist = parseInt(button_clicked.dataset.available)
     if (!document.contains(text_field_div)){
         // Aktivace buttonu
-        button_clicked = document.getElementById(cislo_stolu)
         button_clicked.classList.add("clicked")
 
         // Vytváření labelu k textovému poli
@@ -85,8 +86,8 @@ function oncheck(cislo_stolu, volnych_mist, cislo_v_salu, sal_str){
     } else {
 
         // Deaktivace buttonu
-        button_clicked = document.getElementById(cislo_stolu)
         button_clicked.classList.remove("clicked")
+        button_clicked.disabled = (button_clicked.dataset.available == 0)
         
 
         // Odstraní všechny objekty
@@ -94,4 +95,52 @@ function oncheck(cislo_stolu, volnych_mist, cislo_v_salu, sal_str){
     }
 
     zobraz_cenu() // Změní celkovou cenu
-}
\ No newline at end of file
+}
+
+
+function set_table_availability(button, available_seats){
+    // Shows the available seats on the table's button (a chosen table stays enabled so it can be unchosen)
+    button.dataset.available = available_seats
+    button.value = available_seats.toString() + " " + button.dataset.number
+    button.title = "Table no. " + button.dataset.number + ", available seats: " + available_seats.toString()
+    button.disabled = (available_seats == 0 && !button.classList.contains("clicked"))
+}
+
+
+function fill_availability(tables){
+    buttons = document.getElementsByName("stul")
+    for (i=0;i<buttons.length;i++){
+        set_table_availability(buttons[i], tables[buttons[i].id] || 0)
+    }
+}
+
+
+function update_availability(tables){
+    // Updates only the tables which changed
+    for (table_id in tables){
+        button = document.getElementById(table_id)
+        if (button != null){
+            set_table_availability(button, tables[table_id])
+        }
+    }
+}
+
+
+function load_availability(){
+    // The server answers with 304 (a few hundred bytes) when nothing changed since the last request
+    fetch(availability_url)
+        .then(response => response.json())
+        .then(data => fill_availability(data.tables))
+}
+
+
+if (availability_events_url && window.EventSource){
+    // Only when the server pushes the changes (AVAILABILITY_EVENTS) - the first event has all the tables, then the server pushes only the changed ones
+    availability_events = new EventSource(availability_events_url)
+    availability_events.onmessage = function(event){
+        update_availability(JSON.parse(event.data).tables)
+    }
+} else {
+    load_availability()
+    setInterval(load_availability, availability_poll_seconds * 1000)
+}